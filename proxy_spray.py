@@ -1,19 +1,25 @@
 #!/usr/bin/env python3
 
 import argparse
-import requests
+import aiohttp
+import asyncio
 import ipaddress
 import re
 import pdb
+from collections import defaultdict
+from itertools import chain
 from sys import stderr
-from multiprocessing.pool import Pool
 from pathlib import Path
-from time import sleep
 
 # Disable Warnings
 import warnings
 warnings.filterwarnings('ignore')
 
+# Compiled regular expressions
+_HEADER_RE = re.compile(r'^(.+?):\s+(.+)$')
+_CIDR_RE = re.compile(r'^[\d.]+/\d{1,2}$')
+_SCHEME_RE = re.compile(r'^([A-Za-z][A-Za-z0-9+.-]*)://')
+
 # =========
 # INTERFACE
 # =========
@@ -37,7 +43,9 @@ misc_group.add_argument('--http-headers','-he',
 misc_group.add_argument('--process-count','-pc',
     default=4,
     type=int,
-    help='Count of processes to use during execution.')
+    help='''Concurrency factor used during execution. Up to 64
+    requests per unit will be in flight at any given time.
+    ''')
 
 input_group = parser.add_argument_group('Input Configurations',
     description='''Pass inputs to the script.
@@ -73,24 +81,6 @@ assumption_group.add_argument('--no-assume-http','-nahttp',
 
 # == END INTERFACE ==
 
-# =================
-# CLASS DEFINITIONS
-# =================
-
-class ProxyDict(dict):
-    '''Simple `dict`-like object with an `appendProxy` method
-    that simplifies the process of adding new proxies.
-    '''
-
-    def appendProxy(self,scheme,proxy):
-
-        if scheme in self:
-            proxies[scheme].append(proxy)
-        else:
-            proxies[scheme] = [proxy]
-
-# == END CLASS DEFINITIONS ==
-
 # ====================
 # FUNCTION DEFINITIONS
 # ====================
@@ -100,82 +90,70 @@ def parseProxy(s):
     in the form of `(scheme,url)`.
     '''
 
-    match = re.search('^(https?://)(.+)',s,re.I)
-    assert match, f'Invalid proxy/proxy file supplied: {s}'
-    return match.groups()[0].split(':')[0],s
+    scheme,sep,rest = s.partition('://')
+    scheme = scheme.casefold()
+    assert sep and rest and scheme in ('http','https'), \
+            f'Invalid proxy/proxy file supplied: {s}'
+    return scheme,s
 
 def assumeIPTarget(t):
-    '''Generate IP target assumptions. Returns a list of URL strings
-    with http(s):// prefixed where necessary.
+    '''Generate IP target assumptions. Yields `(scheme,url)`
+    tuples with http(s):// prefixed where necessary.
     '''
 
-    output = []
-    if not args.no_assume_http: output.append(f'http://{t}')
-    if not args.no_assume_https: output.append(f'https://{t}')
-    return output
+    if not args.no_assume_http: yield 'http',f'http://{t}'
+    if not args.no_assume_https: yield 'https',f'https://{t}'
 
 def assumeURLTarget(t):
-    '''Generate URL target assumptions. Returns a list of URL strings
-    with http(s):// prefixed where necessary.
+    '''Generate URL target assumptions for a target without a
+    scheme. Yields `(scheme,url)` tuples with http(s):// prefixed.
     '''
 
-    output = []
-
-    if not args.no_assume_http:
-        if not t.startswith('http') and not t.startswith('https'):
-            output.append(f'http://{t}')
-
-    if not args.no_assume_https:
-        if not t.startswith('https') and not t.startswith('http'):
-            output.append(f'https://{t}')
-
-    return output
+    if not args.no_assume_http: yield 'http',f'http://{t}'
+    if not args.no_assume_https: yield 'https',f'https://{t}'
 
 def parseHeader(h):
     '''Parse an HTTP header string and return a tuple in the
     following form: (header_key,header_value)
     '''
 
-    split = [v for v in re.split('^(.+):\s{1,}(.+)$',h) if v]
-    assert split.__len__() == 2, f'Invalid header supplied: {h}'
-    return split[0],split[1]
+    match = _HEADER_RE.match(h)
+    assert match, f'Invalid header supplied: {h}'
+    return match.group(1),match.group(2)
     
 
 def parseTarget(t):
-    '''Parse the target, make URL assumptions, and then return
-    a list of the final output values.
+    '''Parse the target, make URL assumptions, and then yield
+    the final output values as `(scheme,url)` tuples. Targets with
+    a scheme other than http(s) are discarded.
     '''
 
     # Use an RE to determine if this is a CIDR string
-    if re.search('/[0-9]{,2}$',t):
+    if _CIDR_RE.match(t):
         t = ipaddress.IPv4Network(t,strict=False)
-    # Treat as an individual IP address otherwise
-    else:
-        # Catch any assertions and then assume the
-        # input is simply a URL
+    # Only values made of digits and dots can be an IP address,
+    # anything else is assumed to be a URL
+    elif t.replace('.','').isdigit():
         try:
             t = ipaddress.IPv4Address(t)
-        except:
+        except ipaddress.AddressValueError:
             pass
 
     # Expand and assume for any IPv4 network
-    if t.__class__ == ipaddress.IPv4Network:
-        output = []
-        for ip in t:
-            output += assumeIPTarget(ip)
-        return output
+    if isinstance(t,ipaddress.IPv4Network):
+        yield from chain.from_iterable(map(assumeIPTarget,t))
 
     # Handle an individual IP address
-    elif t.__class__ == ipaddress.IPv4Address:
-        return assumeIPTarget(t)
+    elif isinstance(t,ipaddress.IPv4Address):
+        yield from assumeIPTarget(t)
 
     # Handle an individual URL target
     else:
-        nt = assumeURLTarget(t)
-        if not nt:
-            return [t]
-        else:
-            return nt
+        scheme = targetScheme(t)
+        if scheme in ('http','https'):
+            yield scheme,t
+        elif not scheme:
+            yield from assumeURLTarget(t)
 
 def isFile(s):
     '''Determine if the input value (s) is a file name and
@@ -189,47 +167,118 @@ def isFile(s):
 
 def printResult(out):
 
-    s =  out[2] + ' >--[VIA]--> ' + list(out[1].values())[0]
+    s =  out[2] + ' >--[VIA]--> ' + out[1]
     if out[0]:
         print('SUCCESS: '+s)
     elif args.display_failures:
         print(f'FAILURE: '+s)
 
-def compareSchemes(v0,v1):
+def targetScheme(t):
+    '''Return the lowercased scheme of a target URL, or an empty
+    string when the target has none.
+    '''
 
-    r = '^(https?)'
-    rv0, rv1 = re.search(r,v0), re.search(r,v1)
-    if rv0 and rv1 and rv0.groups()[0] == rv1.groups()[0]:
-        return True
-    else:
-        return False
+    match = _SCHEME_RE.match(t)
+    return match.group(1).casefold() if match else ''
 
-def genericRequestsCallback(proxy,target,verify=False,
+async def genericRequestsCallback(session,proxy,target,verify=False,
         allow_redirects=False,headers=None):
     '''Generic HTTP request callback that returns a simple tuple
     communicating if the request completed successfully. The output
     tuple is structured as:
 
-    (True/False,proxy_argument_received,target_argument_received)
+    (True/False,proxy_argument_received,target_argument_received,
+        status_code_or_None,exception_repr_or_None)
 
     '''
 
     headers = headers or {}
 
     try:
-        resp = requests.get(target,
-                    proxies=proxy,
-                    verify=verify,
+        async with session.get(target,
+                    proxy=proxy,
+                    ssl=verify,
                     allow_redirects=allow_redirects,
-                    headers=headers)
+                    headers=headers) as resp:
+
+            status = resp.status
 
-        if resp.status_code == 403:
-            raise Exception('403 Forbidden Response')
+        if status == 403:
+            return (False,proxy,target,status,'403 Forbidden Response')
 
-        return (True,proxy,target,resp,None)
+        return (True,proxy,target,status,None)
 
     except Exception as e:
-        return (False,proxy,target,None,e)
+        return (False,proxy,target,None,repr(e))
+
+def newSession():
+    '''Return an `aiohttp.ClientSession` with a connector that closes
+    each connection once its request completes. aiohttp pools
+    connections by target host and proxy, so a proxy connection
+    cannot be reused across distinct targets, and keeping them
+    alive would only leave idle sockets exhausting file descriptors.
+    '''
+
+    return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=0,ssl=False,
+                force_close=True))
+
+async def sprayProxies(proxies,targets,headers):
+    '''Send a request for each target through each proxy with a
+    matching scheme, printing results as they complete. Both
+    `proxies` and `targets` are dicts of URL lists keyed by scheme.
+    All requests share a single session.
+
+    Work is handed to a fixed set of workers through a bounded
+    queue, so new requests are only queued once a worker is free
+    to take them. An exception raised by any worker stops the
+    remaining work and is raised to the caller.
+    '''
+
+    concurrency = args.process_count*64
+    queue = asyncio.Queue(maxsize=concurrency)
+
+    async def worker():
+        while True:
+            proxy,target = await queue.get()
+            try:
+                printResult(await genericRequestsCallback(
+                    session,proxy,target,headers=headers))
+            finally:
+                queue.task_done()
+
+    async def feed():
+        for scheme,plist in proxies.items():
+
+            for proxy in plist:
+
+                for target in targets[scheme]:
+                    await queue.put((proxy,target))
+
+        print('[+] Final requests queued, awaiting responses',file=stderr)
+        await queue.join()
+
+    session = newSession()
+    tasks = [asyncio.create_task(feed())] + \
+            [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+
+        # Workers only finish by failing, so this returns once the
+        # queue is drained or as soon as any task raises
+        done,_ = await asyncio.wait(tasks,
+                return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+
+    finally:
+        pending = [t for t in tasks if not t.done()]
+        for task in pending: task.cancel()
+        if pending: await asyncio.wait(pending)
+
+        # Only the first failure is raised, mark any others as seen
+        for task in tasks:
+            if not task.cancelled(): task.exception()
+        await session.close()
 
 if __name__ == '__main__':
     
@@ -240,6 +289,8 @@ if __name__ == '__main__':
     # ================
     
     args = parser.parse_args()
+    if args.process_count < 1:
+        parser.error('--process-count must be at least 1')
     
     print(
     '\n  _ \                      __|\n' \
@@ -250,43 +301,47 @@ if __name__ == '__main__':
     # == Handle proxies ==
     
     print('[+] Loading proxies...',end='',file=stderr)
-    proxies = []
+    proxies, seen_proxies = defaultdict(list), set()
     for p in args.proxy_urls:
         
         # Handle a file of proxies
         pth = isFile(p)
         if pth:
-            with open(pth) as infile:
-                for proxy in infile:
-                    scheme,proxy = parseProxy(proxy.strip())
-                    proxy = {scheme:proxy}
-                    if proxy in proxies: continue
-                    proxies.append(proxy)
+            for scheme,proxy in map(parseProxy,
+                    pth.read_text().split()):
+                if (scheme,proxy) in seen_proxies: continue
+                seen_proxies.add((scheme,proxy))
+                proxies[scheme].append(proxy)
     
         # Handle an individual proxy
         else:
             scheme,proxy = parseProxy(p)
-            proxy = {scheme:proxy}
-            if proxy in proxies: continue
-            proxies.append({scheme:proxy})
+            if (scheme,proxy) in seen_proxies: continue
+            seen_proxies.add((scheme,proxy))
+            proxies[scheme].append(proxy)
     
     print('done!',file=stderr)
     # == END handle proxies ==
     # == Handle targets ==
     print('[+] Loading targets...',end='',file=stderr)
-    targets = []
+    targets, seen_targets = defaultdict(list), set()
     for t in args.targets:
     
         # Handle a file of targets
         pth = isFile(t)
         if pth:
-            with open(pth) as infile:
-                for target in infile:
-                    targets += parseTarget(target.strip())
+            for target in pth.read_text().split():
+                for scheme,url in parseTarget(target):
+                    if url in seen_targets: continue
+                    seen_targets.add(url)
+                    targets[scheme].append(url)
     
         # Handle an individual target
         else:
-            targets += parseTarget(t)
+            for scheme,url in parseTarget(t):
+                if url in seen_targets: continue
+                seen_targets.add(url)
+                targets[scheme].append(url)
     print('done!',file=stderr)
     # == END handle targets ==
     # == Handle headers ==
@@ -297,10 +352,9 @@ if __name__ == '__main__':
     
         pth = isFile(h)
         if pth:
-            with open(pth) as infile:
-                for header in infile:
-                    key,value = parseHeader(header)
-                    headers[key] = value
+            for key,value in map(parseHeader,
+                    pth.read_text().splitlines()):
+                headers[key] = value
     
         else:
             key,value = parseHeader(h)
@@ -317,65 +371,8 @@ if __name__ == '__main__':
     if not args.display_failures:
         print('[+] Failed requests will not be displayed',file=stderr)
     
-    # Initialize variables for multiprocessing
-    pool, results = Pool(args.process_count), []
-    tcount = targets.__len__()
-    
     # Send the requests
-    for proxy in proxies:
-    
-        for target in targets:
-    
-            # Assure protocols are matching, skip otherwise
-            if not compareSchemes(list(proxy.values())[0],target):
-                continue
-    
-            # Handle maximum parallel execution
-            while results.__len__() == args.process_count:
-    
-                # Detect and display completed requests
-                to_del = []
-                for res in results:
-                    if res.ready():
-                        printResult(res.get())
-                        to_del.append(res)
-    
-                # Delete complete results
-                if to_del:
-                    for res in to_del:
-                        del(results[results.index(res)])
-                    to_del.clear()
-    
-                # Depending on if requests or ongoing, break or sleep
-                if results.__len__() < args.process_count:
-                    break
-                else:
-                    sleep(.5)
-    
-            # Perform the next request
-            results.append(
-                    pool.apply_async(
-                        genericRequestsCallback,(),{'proxy':proxy,
-                            'target':target,'headers':headers})
-                )
-    
-            sleep(.25)
-    
-    # Wait and report on pending results
-    print('[+] Final requests sent, awaiting responses',file=stderr)
-    while results:
-    
-        result = results[0]
-    
-        if result.ready():
-            printResult(result.get())
-            del(results[results.index(result)])
-    
-        if results: sleep(.5)
+    asyncio.run(sprayProxies(proxies,targets,headers))
     print('[+] Execution complete',file=stderr)
     
-    # Close up the pool
-    pool.close()
-    pool.join()
-    
     # == END MAIN LOGIC ==